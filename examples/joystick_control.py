@@ -130,7 +130,9 @@ if __name__ == "__main__":
     #robot = urx.Robot('localhost')
     #set a base transformation for robot (optional)
     robot.set_tcp((0, 0, 0, 0, 0, 0))
-    robot.csys.orient.rotate_zb(-pi/4)
+    csys = robot.csys.copy()
+    csys.orient.rotate_zb(-pi/4)
+    robot.set_csys(csys)
     
     #start joystick service with given max speed and acceleration
     service = Service(robot, linear_velocity=0.1, rotational_velocity=0.1, acceleration=0.1)
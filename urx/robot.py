@@ -9,24 +9,148 @@ __copyright__ = "Copyright 2011-2015, Sintef Raufoss Manufacturing"
 __license__ = "GPLv3"
 
 import logging
+from contextlib import contextmanager
+from functools import lru_cache
 
-
-MATH3D = True
-try:
-    import math3d as m3d
-    import numpy as np
-except ImportError:
-    MATH3D = False
-    print("python-math3d library could not be found on this computer, disabling use of matrices and path blending")
+import numpy as np
 
 from urx import urrtmon
 from urx import ursecmon
 
 
+# URScript templates, built once instead of on every command
+# %s is replaced by the 6 vector format for URRobot.max_float_length decimals, see _template
+_PROG_HEADER = b"def myProg():\n"
+_PROG_END = b"end\n"
+_SET_TCP_TPL = "set_tcp(p[{}, {}, {}, {}, {}, {}])"
+_SPEEDL_TPL = "speedl([%s], a={}, t_min={})"
+_SPEEDJ_TPL = "speedj([%s], a={}, t_min={})"
+_MOVEJ_TPL = "movej([%s], a={}, v={}, r={})"
+_MOVEL_TPL = "movel(p[%s], a={}, v={}, r={})"
+_MOVEP_TPL = "movep(p[%s], a={}, v={}, r={})"
+
+
+@lru_cache(maxsize=64)
+def _template(tpl, digits):
+    """
+    return URScript template tpl with its vector printed with digits decimals
+    """
+    return tpl % ",".join(["{:.%sf}" % digits] * 6)
+
+
+@lru_cache(maxsize=64)
+def _digital_out_prog(output, val):
+    return "digital_out[%s]=%s" % (output, "True" if val in (True, 1) else "False")
+
+
+@lru_cache(maxsize=64)
+def _stop_prog(cmd, acc):
+    return "%s(%s)" % (cmd, acc)
+
+
+def _rotvecs_to_matrices(rotvecs):
+    """
+    convert an (N, 3) array of rotation vectors to an (N, 3, 3) array of rotation matrices
+    using Rodrigues formula
+    """
+    theta = np.linalg.norm(rotvecs, axis=1)
+    axes = rotvecs / np.where(theta > 0, theta, 1.0)[:, None]
+    k = np.zeros((len(rotvecs), 3, 3))
+    k[:, 0, 1] = -axes[:, 2]
+    k[:, 0, 2] = axes[:, 1]
+    k[:, 1, 0] = axes[:, 2]
+    k[:, 1, 2] = -axes[:, 0]
+    k[:, 2, 0] = -axes[:, 1]
+    k[:, 2, 1] = axes[:, 0]
+    return np.eye(3) + np.sin(theta)[:, None, None] * k + (1 - np.cos(theta))[:, None, None] * (k @ k)
+
+
+def _twist_rotation(rot):
+    """
+    return the 6x6 block diagonal matrix rotating both the linear and
+    the angular part of a velocity vector by rotation matrix rot
+    """
+    rot6 = np.zeros((6, 6))
+    rot6[:3, :3] = rot
+    rot6[3:, 3:] = rot
+    return rot6
+
+
+def _fast_compose(rot_a, pos_a, rot_b, pos_b):
+    """
+    compose two transforms given as rotation matrix and position vector
+    """
+    return rot_a @ rot_b, rot_a @ pos_b + pos_a
+
+
+def _fast_rotvec(rot):
+    """
+    return rotation vector of a 3x3 rotation matrix
+    """
+    return _matrices_to_rotvecs(rot[np.newaxis])[0]
+
+
+def _matrices_to_rotvecs(mats):
+    """
+    convert an (N, 3, 3) array of rotation matrices to an (N, 3) array of rotation vectors
+    """
+    cos = (np.trace(mats, axis1=1, axis2=2) - 1) / 2
+    w = np.stack((mats[:, 2, 1] - mats[:, 1, 2],
+                  mats[:, 0, 2] - mats[:, 2, 0],
+                  mats[:, 1, 0] - mats[:, 0, 1]), axis=1)
+    sin = np.linalg.norm(w, axis=1) / 2
+    theta = np.arctan2(sin, cos)
+    rotvecs = np.empty((len(mats), 3))
+    regular = sin > 1e-6
+    rotvecs[regular] = w[regular] * (theta[regular] / (2 * sin[regular]))[:, None]
+    small = ~regular & (cos > 0)
+    rotvecs[small] = w[small] / 2
+    # angle close to pi: axis is read from symmetric part of matrix, sign from skew part
+    for i in np.flatnonzero(~regular & (cos <= 0)):
+        b = (mats[i] + mats[i].T) / 2 - cos[i] * np.eye(3)
+        j = np.argmax(np.diag(b))
+        axis = b[:, j] / np.sqrt(b[j, j] * (1 - cos[i]))
+        if axis.dot(w[i]) < 0:
+            axis = -axis
+        rotvecs[i] = axis * theta[i]
+    return rotvecs
+
+
+m3d = None  # python-math3d module, imported by _get_m3d() when a Robot is created
+
+
 class RobotException(Exception):
     pass
 
 
+def _as_vector(vect):
+    """
+    return vect as a math3d Vector, vect is not copied if it already is one
+    """
+    return vect if hasattr(vect, "array") else m3d.Vector(vect)
+
+
+def _as_orientation(orient):
+    """
+    return orient as a math3d Orientation, orient is not copied if it already is one
+    """
+    return orient if hasattr(orient, "rotation_vector") else m3d.Orientation(orient)
+
+
+def _get_m3d():
+    """
+    import python-math3d on first use, so URRobot can be used without it
+    """
+    global m3d
+    if m3d is None:
+        try:
+            import math3d
+        except ImportError:
+            raise RobotException("python-math3d library could not be found on this computer, use URRobot class to work without matrices")
+        m3d = math3d
+    return m3d
+
+
 class URRobot(object):
 
     """
@@ -36,23 +160,28 @@ class URRobot(object):
     Since parsing the RT interface uses som CPU, and does not support all robots versions, it is disabled by default
     The RT interfaces is only used for the get_force related methods
     Rmq: A program sent to the robot i executed immendiatly and any running program is stopped
+    subscribe optionally restricts the secondary interface packet types which are decoded, see SecondaryMonitor,
+    getj needs type 1 (JointData), getl and get_pose type 4 (CartesianInfo) and digital/analog IO type 3 (MasterBoardData)
     """
 
-    def __init__(self, host, use_rt=False):
+    def __init__(self, host, use_rt=False, subscribe=None):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.host = host
         self.csys = None
 
         self.logger.info("Opening secondary monitor socket")
-        self.secmon = ursecmon.SecondaryMonitor(self.host)  # data from robot at 10Hz
+        self.secmon = ursecmon.SecondaryMonitor(self.host, subscribe)  # data from robot at 10Hz
 
         self.rtmon = None
         if use_rt:
             self.rtmon = self.get_realtime_monitor()
-        # the next 3 values must be conservative! otherwise we may wait forever
+        # the next 2 values must be conservative! otherwise we may wait forever
         self.joinEpsilon = 0.01  # precision of joint movem used to wait for move completion
+        self.program_start_timeout = 3  # max number of packets from robot to wait for a program to start running
         # It seems URScript is  limited in the character length of floats it accepts
         self.max_float_length = 6  # FIXME: check max length!!!
+        self._batch = None  # list of programs buffered by batched()
+        self._packet_cache = (None, {})  # (secmon packet id, values computed from that packet)
 
         self.secmon.wait()  # make sure we get data from robot before letting clients access our methods
 
@@ -78,10 +207,68 @@ class URRobot(object):
         send a complete program using urscript to the robot
         the program is executed immediatly and any runnning
         program is interrupted
+        inside a batched() block the program is buffered instead
         """
+        if self._batch is not None:
+            self._batch.append(prog)
+            return
         self.logger.info("Sending program: " + prog)
+        self._clear_packet_cache()
         self.secmon.send_program(prog)
 
+    def send_batch(self, lines):
+        """
+        send a list of URScript lines to the robot as one program
+        """
+        if self._batch is not None:
+            self._batch.extend(lines)
+            return
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("Sending program: %s", "\n".join(lines))
+        chunks = [_PROG_HEADER]
+        chunks.extend(line.encode() + b"\n" for line in lines)
+        chunks.append(_PROG_END)
+        self._clear_packet_cache()
+        self.secmon.send_program_bytes(chunks)
+
+    @contextmanager
+    def batched(self):
+        """
+        buffer all commands sent inside the with block and send them
+        to the robot as one program when leaving the block.
+        Nothing is sent if an exception is raised inside the block.
+        Motion commands must be called with wait=False and relative moves
+        are computed from the pose of the robot before the batch is sent
+        """
+        if self._batch is not None:
+            raise RobotException("Commands are already being batched")
+        self._batch = []
+        try:
+            yield self
+            lines = self._batch
+        finally:
+            self._batch = None
+        if lines:
+            self.send_batch(lines)
+
+    def _get_cached(self, key, wait, compute):
+        """
+        return value computed by compute() from last packet received from robot
+        compute() is called only once per packet, until a new program is sent
+        """
+        if wait:
+            self.secmon.wait()
+        pid = self.secmon.get_packet_id()
+        if pid != self._packet_cache[0]:
+            self._packet_cache = (pid, {})
+        values = self._packet_cache[1]
+        if key not in values:
+            values[key] = compute()
+        return values[key]
+
+    def _clear_packet_cache(self):
+        self._packet_cache = (None, {})
+
     def get_tcp_force(self, wait=True):
         """
         return measured force in TCP
@@ -95,16 +282,13 @@ class URRobot(object):
         if wait==True, waits for next packet before returning
         """
         tcpf = self.get_tcp_force(wait)
-        force = 0
-        for i in tcpf:
-            force += i**2
-        return force**0.5
+        return float(np.linalg.norm(np.asarray(tcpf, dtype=np.float64)))
 
     def set_tcp(self, tcp):
         """
         set robot flange to tool tip transformation
         """
-        prog = "set_tcp(p[{}, {}, {}, {}, {}, {}])".format(*tcp)
+        prog = _SET_TCP_TPL.format(*tcp)
         self.logger.info("Sending program: " + prog)
         self.send_program(prog)
 
@@ -140,11 +324,7 @@ class URRobot(object):
         """
         set digital output. val is a bool
         """
-        if val in (True, 1):
-            val = "True"
-        else:
-            val = "False"
-        self.send_program('digital_out[%s]=%s' % (output, val))
+        self.send_program(_digital_out_prog(output, val))
 
     def get_analog_inputs(self):
         """
@@ -195,58 +375,100 @@ class URRobot(object):
         wait until a move is completed
         radius and target args are ignored
         """
+        if self._batch is not None:
+            raise RobotException("Cannot wait for move completion while batching commands, use wait=False")
         try:
             self._wait_for_move(radius, target)
-        except Exception as ex:
-            print("EXceptino!!!!!")
+        except Exception:
+            self.logger.exception("Error while waiting for move completion, stopping robot")
             self.stopj()
-            raise(ex)
+            raise
+
+    async def a_wait_for_move(self, radius=0, target=None):
+        """
+        coroutine version of wait_for_move, to be used from an asyncio event loop
+        together with a move command sent with wait=False
+        """
+        if self._batch is not None:
+            raise RobotException("Cannot wait for move completion while batching commands, use wait=False")
+        try:
+            self.logger.debug("Waiting for move completion")
+            # it is necessary to wait since robot may takes a while to get into running state,
+            while not self._program_start_done():
+                await self.secmon.wait_async()
+            while True:
+                await self.secmon.wait_async()
+                if self._is_move_finished(radius, target):
+                    return
+        except Exception:
+            self.logger.exception("Error while waiting for move completion, stopping robot")
+            self.stopj()
+            raise
 
     def _wait_for_move(self, radius=0, target=None):
         self.logger.debug("Waiting for move completion")
         # it is necessary to wait since robot may takes a while to get into running state,
-        for _ in range(3):
+        while not self._program_start_done():
             self.secmon.wait()
         while True:
-            if not self.is_running():
-                raise RobotException("Robot stopped")
-            jts = self.secmon.get_joint_data(wait=True)
-            finished = True
-            for i in range(0, 6):
-                # Rmq: q_target is an interpolated target we have no control over
-                if abs(jts["q_actual%s" % i] - jts["q_target%s" % i]) > self.joinEpsilon:
-                    self.logger.debug("Waiting for end move, q_actual is %s, q_target is %s, diff is %s, epsilon is %s", jts["q_actual%s" % i], jts["q_target%s" % i], jts["q_actual%s" % i] - jts["q_target%s" % i], self.joinEpsilon)
-                    finished = False
-                    break
-            if finished and not self.secmon.is_program_running():
-                self.logger.debug("move has ended")
+            self.secmon.wait()
+            if self._is_move_finished(radius, target):
                 return
 
+    def _program_start_done(self):
+        """
+        True once the last program has been written to the robot and a packet received afterwards
+        reports a running program, or when program_start_timeout packets have been received since the write
+        """
+        sent_pid = self.secmon.get_program_packet_id()
+        if sent_pid is None:
+            return False  # program still waiting in secmon queue
+        pid = self.secmon.get_packet_id()
+        # the first packet parsed after the write may have left the robot before the program arrived
+        # and still report the previous program running
+        return (pid > sent_pid + 1 and self.secmon.is_program_running()) or pid - sent_pid >= self.program_start_timeout
+
+    def _is_move_finished(self, radius, target):
+        """
+        check last packet from robot for move completion
+        """
+        if not self.is_running():
+            raise RobotException("Robot stopped")
+        q_actual, q_target = self.secmon.get_joint_arrays()
+        # Rmq: q_target is an interpolated target we have no control over
+        if abs(q_actual - q_target).max() > self.joinEpsilon:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Waiting for end move, q_actual is %s, q_target is %s, diff is %s, epsilon is %s", q_actual, q_target, q_actual - q_target, self.joinEpsilon)
+            return False
+        if not self.secmon.is_program_running():
+            self.logger.debug("move has ended")
+            return True
+        return False
+
     def getj(self, wait=False):
         """
         get joints position
         """
-        jts = self.secmon.get_joint_data(wait)
-        return [jts["q_actual0"], jts["q_actual1"], jts["q_actual2"], jts["q_actual3"], jts["q_actual4"], jts["q_actual5"]]
+        return list(self._get_cached("getj", wait, self._read_joints))
+
+    def _read_joints(self):
+        q_actual, _ = self.secmon.get_joint_arrays()
+        return q_actual.tolist()
 
     def speedl(self, velocities, acc, min_time):
         """
         move at given velocities until minimum min_time seconds
         """
-        vels = [round(i, self.max_float_length) for i in velocities]
-        vels.append(acc)
-        vels.append(min_time)
-        prog = "speedl([{},{},{},{},{},{}], a={}, t_min={})".format(*vels)
+        vels = np.round(velocities, self.max_float_length)
+        prog = _template(_SPEEDL_TPL, self.max_float_length).format(*vels, acc, min_time)
         self.send_program(prog)
 
     def speedj(self, velocities, acc, min_time):
         """
         move at given joint velocities until minimum min_time seconds
         """
-        vels = [round(i, self.max_float_length) for i in velocities]
-        vels.append(acc)
-        vels.append(min_time)
-        prog = "speedj([{},{},{},{},{},{}], a={}, t_min={})".format(*vels)
+        vels = np.round(velocities, self.max_float_length)
+        prog = _template(_SPEEDJ_TPL, self.max_float_length).format(*vels, acc, min_time)
         self.send_program(prog)
 
     def movej(self, joints, acc=0.1, vel=0.05, radius=0, wait=True, relative=False):
@@ -254,18 +476,14 @@ class URRobot(object):
         move in joint space
         """
         if relative:
-            l = self.getj()
-            joints = [v + l[i] for i, v in enumerate(joints)]
-        joints = [round(j, self.max_float_length) for j in joints]
-        joints.append(acc)
-        joints.append(vel)
-        joints.append(radius)
-        prog = "movej([{},{},{},{},{},{}], a={}, v={}, r={})".format(*joints)
+            joints = np.add(joints, self.getj())
+        joints = np.round(joints, self.max_float_length)
+        prog = _template(_MOVEJ_TPL, self.max_float_length).format(*joints, acc, vel, radius)
         self.send_program(prog)
         if not wait:
             return None
         else:
-            self.wait_for_move(radius, joints[:6])
+            self.wait_for_move(radius, joints.tolist())
             return self.getj()
 
     def movel(self, tpose, acc=0.01, vel=0.01, radius=0, wait=True, relative=False):
@@ -273,19 +491,14 @@ class URRobot(object):
         linear move
         """
         if relative:
-            l = self.getl()
-            tpose = [v + l[i] for i, v in enumerate(tpose)]
-        tpose = [round(i, self.max_float_length) for i in tpose]
-        #prog = "movel(p%s, a=%s, v=%s)" % (tpose, acc, vel)
-        tpose.append(acc)
-        tpose.append(vel)
-        tpose.append(radius)
-        prog = "movel(p[{},{},{},{},{},{}], a={}, v={}, r={})".format(*tpose)
+            tpose = np.add(tpose, self.getl())
+        tpose = np.round(tpose, self.max_float_length)
+        prog = _template(_MOVEL_TPL, self.max_float_length).format(*tpose, acc, vel, radius)
         self.send_program(prog)
         if not wait:
             return None
         else:
-            self.wait_for_move(radius, tpose[:6])
+            self.wait_for_move(radius, tpose.tolist())
             return self.getl()
 
     def movep(self, tpose, acc=0.01, vel=0.01, radius=0, wait=True, relative=False):
@@ -293,28 +506,29 @@ class URRobot(object):
         Send a movep command to the robot. See URScript documentation.
         """
         if relative:
-            l = self.getl()
-            tpose = [v + l[i] for i, v in enumerate(tpose)]
-        tpose = [round(i, self.max_float_length) for i in tpose]
-        #prog = "movel(p%s, a=%s, v=%s)" % (tpose, acc, vel)
-        tpose.append(acc)
-        tpose.append(vel)
-        tpose.append(radius)
-        prog = "movep(p[{},{},{},{},{},{}], a={}, v={}, r={})".format(*tpose)
+            tpose = np.add(tpose, self.getl())
+        tpose = np.round(tpose, self.max_float_length)
+        prog = _template(_MOVEP_TPL, self.max_float_length).format(*tpose, acc, vel, radius)
         self.send_program(prog)
         if not wait:
             return None
         else:
-            self.wait_for_move(radius, tpose[:6])
+            self.wait_for_move(radius, tpose.tolist())
             return self.getl()
 
     def getl(self, wait=False):
         """
         get TCP position
         """
-        pose = self.secmon.get_cartesian_info(wait)
-        if pose:
-            pose = [pose["X"], pose["Y"], pose["Z"], pose["Rx"], pose["Ry"], pose["Rz"]]
+        pose = self._get_cached("getl", wait, self._read_cartesian_pose)
+        if pose is not None:
+            pose = list(pose)
+        return pose
+
+    def _read_cartesian_pose(self):
+        pose = self.secmon.get_cartesian_array()
+        if pose is not None:
+            pose = pose.tolist()
         self.logger.debug("Current pose from robot: " + str(pose))
         return pose
 
@@ -340,20 +554,17 @@ class URRobot(object):
         This method is usefull since any new command from python
         to robot make the robot stop
         """
-        header = "def myProg():\n"
-        end = "end\n"
-        template = "movel(p[{},{},{},{},{},{}], a={}, v={}, r={})\n"
-        prog = header
-        for idx, pose in enumerate(pose_list):
-            pose.append(acc)
-            pose.append(vel)
-            if idx != (len(pose_list) - 1):
-                pose.append(radius)
-            else:
-                pose.append(0)
-            prog += template.format(*pose)
-        prog += end
-        self.send_program(prog)
+        if len(pose_list) == 0:
+            raise RobotException("movels needs at least one pose")
+        args = np.empty((len(pose_list), 9))
+        args[:, :6] = pose_list
+        args[:, 6] = acc
+        args[:, 7] = vel
+        args[:-1, 8] = radius
+        args[-1, 8] = 0
+        np.round(args, self.max_float_length, out=args)
+        tpl = _template(_MOVEL_TPL, self.max_float_length)
+        self.send_batch([tpl.format(*row) for row in args.tolist()])
         if not wait:
             return None
         else:
@@ -361,10 +572,10 @@ class URRobot(object):
             return self.getl()
 
     def stopl(self, acc=0.5):
-        self.send_program("stopl(%s)" % acc)
+        self.send_program(_stop_prog("stopl", acc))
 
     def stopj(self, acc=1.5):
-        self.send_program("stopj(%s)" % acc)
+        self.send_program(_stop_prog("stopj", acc))
 
     def stop(self):
         self.stopj()
@@ -415,35 +626,61 @@ class Robot(URRobot):
     and includes support for setting a reference coordinate system
     """
 
-    def __init__(self, host, use_rt=False):
-        URRobot.__init__(self, host, use_rt)
+    def __init__(self, host, use_rt=False, subscribe=None):
+        _get_m3d()
+        URRobot.__init__(self, host, use_rt, subscribe)
         self.default_linear_acceleration = 0.01
         self.default_linear_velocity = 0.01
-        self.csys = m3d.Transform()
+        self.set_csys(m3d.Transform())
 
     def set_tcp(self, tcp):
         """
         set robot flange to tool tip transformation
         """
-        if isinstance(tcp, m3d.Transform):
-            tcp = tcp.pose_vector
+        tcp = getattr(tcp, "pose_vector", tcp)
         URRobot.set_tcp(self, tcp)
 
     def set_csys(self, transform):
         """
         Set reference coordinate system to use
+        Values derived from csys are cached, they are recomputed if csys is later modified in place
+        """
+        self._csys = transform
+        self._csys_mat = transform.array
+        self._csys_inv = transform.inverse
+        self._csys_rot = transform.orient.array
+        self._csys_pos = transform.pos.array
+        self._csys_rot6 = _twist_rotation(self._csys_rot)
+        self._clear_packet_cache()
+
+    @property
+    def csys(self):
+        """
+        reference coordinate system, assigning it calls set_csys
+        """
+        return self._csys
+
+    @csys.setter
+    def csys(self, transform):
+        if transform is None:  # set by URRobot.__init__ before Robot sets its default csys
+            self._csys = None
+        else:
+            self.set_csys(transform)
+
+    def _sync_csys(self):
+        """
+        recompute cached csys values if csys has been modified in place, i.e. robot.csys.orient.rotate_zb(a)
         """
-        self.csys = transform
+        if not np.array_equal(self._csys.array, self._csys_mat):
+            self.set_csys(self._csys)
 
     def set_orientation(self, orient, acc=None, vel=None, radius=0, wait=True):
         """
         set tool orientation using a orientation matric from math3d
         or a orientation vector
         """
-        if not isinstance(orient, m3d.Orientation):
-            orient = m3d.Orientation(orient)
         trans = self.get_pose()
-        trans.orient = orient
+        trans.orient = _as_orientation(orient)
         self.set_pose(trans, acc, vel, radius, wait=wait)
 
     def translate(self, vect, acc=None, vel=None, radius=0, wait=True):
@@ -451,9 +688,7 @@ class Robot(URRobot):
         move tool in base coordinate, keeping orientation
         """
         t = m3d.Transform()
-        if not isinstance(vect, m3d.Vector):
-            vect = m3d.Vector(vect)
-        t.pos += m3d.Vector(vect)
+        t.pos += _as_vector(vect)
         return self.add_pose_base(t, acc, vel, radius, wait=wait)
 
     def translate_tool(self, vect, acc=None, vel=None, radius=0, wait=True):
@@ -461,18 +696,14 @@ class Robot(URRobot):
         move tool in tool coordinate, keeping orientation
         """
         t = m3d.Transform()
-        if not isinstance(vect, m3d.Vector):
-            vect = m3d.Vector(vect)
-        t.pos += vect
+        t.pos += _as_vector(vect)
         return self.add_pose_tool(t, acc, vel, radius, wait=wait)
 
     def set_pos(self, vect, acc=None, vel=None, radius=0, wait=True):
         """
         set tool to given pos, keeping constant orientation
         """
-        if not isinstance(vect, m3d.Vector):
-            vect = m3d.Vector(vect)
-        trans = m3d.Transform(self.get_orientation(), m3d.Vector(vect))
+        trans = m3d.Transform(self.get_orientation(), _as_vector(vect))
         return self.set_pose(trans, acc, vel, radius, wait=wait)
 
     def set_pose(self, trans, acc=None, vel=None, radius=0, wait=True, process=False):
@@ -487,13 +718,15 @@ class Robot(URRobot):
             acc = self.default_linear_acceleration
         if not vel:
             vel = self.default_linear_velocity
-        t = self.csys * trans
+        self._sync_csys()
+        rot, pos = _fast_compose(self._csys_rot, self._csys_pos, trans.orient.array, trans.pos.array)
+        pose_vector = np.concatenate((pos, _fast_rotvec(rot)))
         if process:
-            pose = URRobot.movep(self, t.pose_vector, acc=acc, vel=vel, wait=wait, radius=radius)
+            pose = URRobot.movep(self, pose_vector, acc=acc, vel=vel, wait=wait, radius=radius)
         else:
-            pose = URRobot.movel(self, t.pose_vector, acc=acc, vel=vel, wait=wait, radius=radius)
+            pose = URRobot.movel(self, pose_vector, acc=acc, vel=vel, wait=wait, radius=radius)
         if pose is not None:  # movel does not return anything when wait is False
-            return self.csys.inverse * m3d.Transform(pose)
+            return self._csys_inv * m3d.Transform(pose)
 
     def add_pose_base(self, trans, acc=None, vel=None, radius=0, wait=True, process=False):
         """
@@ -512,11 +745,15 @@ class Robot(URRobot):
     def get_pose(self, wait=False):
         """
         get current transform from base to to tcp
+        the pose is computed only once per packet received from robot
         """
-        pose = URRobot.getl(self, wait)
+        self._sync_csys()
+        return self._get_cached("get_pose", wait, self._read_pose).copy()
+
+    def _read_pose(self):
+        pose = self.secmon.get_cartesian_array()
         self.logger.info("Received pose %s from robot", pose)
-        trans = self.csys.inverse * m3d.Transform(pose)
-        return trans
+        return self._csys_inv * m3d.Transform(pose)
 
     def get_orientation(self, wait=False):
         """
@@ -536,19 +773,16 @@ class Robot(URRobot):
         """
         move at given velocities in base csys until minimum min_time seconds
         """
-        #r = m3d.Transform(velocities)
-        v = self.csys.orient * m3d.Vector(velocities[:3])
-        w = self.csys.orient * m3d.Vector(velocities[3:])
-        URRobot.speedl(self, np.concatenate((v.array, w.array)), acc, min_time)
+        self._sync_csys()
+        URRobot.speedl(self, self._csys_rot6 @ np.asarray(velocities, dtype=np.float64), acc, min_time)
 
     def speedl_tool(self, velocities, acc, min_time):
         """
         move at given velocities in tool csys until minimum min_time seconds
         """
         pose = self.get_pose()
-        v = self.csys.orient * pose.orient * m3d.Vector(velocities[:3])
-        w = self.csys.orient * pose.orient * m3d.Vector(velocities[3:])
-        URRobot.speedl(self, np.concatenate((v.array, w.array)), acc, min_time)
+        rot6 = _twist_rotation(self._csys_rot @ pose.orient.array)
+        URRobot.speedl(self, rot6 @ np.asarray(velocities, dtype=np.float64), acc, min_time)
 
     def movel(self, pose, acc=None, vel=None, wait=True, relative=False, radius=0):
         """
@@ -565,21 +799,27 @@ class Robot(URRobot):
         Concatenate several movep commands and applies a blending radius
         pose_list is a list of pose.
         """
-        new_poses = []
-        for pose in pose_list:
-            t = self.csys * m3d.Transform(pose)
-            pose = t.pose_vector
-            pose = [round(i, self.max_float_length) for i in pose]
-            new_poses.append(pose)
-        return URRobot.movels(self, new_poses, acc, vel, radius, wait=wait)
+        if len(pose_list) == 0:
+            raise RobotException("movels needs at least one pose")
+        poses = np.array([getattr(pose, "pose_vector", pose) for pose in pose_list], dtype=np.float64)
+        # transform all poses at once using homogeneous matrices
+        mats = np.tile(np.eye(4), (len(poses), 1, 1))
+        mats[:, :3, :3] = _rotvecs_to_matrices(poses[:, 3:])
+        mats[:, :3, 3] = poses[:, :3]
+        self._sync_csys()
+        mats = self._csys_mat @ mats
+        poses[:, :3] = mats[:, :3, 3]
+        poses[:, 3:] = _matrices_to_rotvecs(mats[:, :3, :3])
+        return URRobot.movels(self, poses, acc, vel, radius, wait=wait)
 
     def movec(self, pose_via, pose_to, acc=0.01, vel=0.01, radius=0, wait=True):
         """
         Move Circular: Move to position (circular in tool-space)
         see UR documentation
         """
-        via = self.csys * m3d.Transform(pose_via)
-        to = self.csys * m3d.Transform(pose_to)
+        self._sync_csys()
+        via = self._csys * m3d.Transform(pose_via)
+        to = self._csys * m3d.Transform(pose_to)
         return URRobot.movec(self, via.pose_vector, to.pose_vector, acc=acc, vel=vel, radius=radius, wait=wait)
 
     def movel_tool(self, pose, acc=None, vel=None, wait=True):
@@ -604,26 +844,35 @@ class Robot(URRobot):
         return t.pose_vector.tolist()
 
     def set_gravity(self, vector):
-        if isinstance(vector, m3d.Vector):
-            vector = vector.list
-        return URRobot.set_gravity(self, vector)
+        return URRobot.set_gravity(self, getattr(vector, "list", vector))
+
+    async def a_wait_for_move(self, radius=0, target=None):
+        """
+        coroutine version of wait_for_move, to be used from an asyncio event loop
+        together with a move command sent with wait=False
+        target is only needed when radius is not 0, the move then ends radius close to target
+        """
+        if target is not None:
+            target = m3d.Transform(target)
+        await URRobot.a_wait_for_move(self, radius, target)
 
     def _wait_for_move(self, radius, target):
-        self.logger.debug("Waiting for move completion")
-        # it is necessary to wait since robot may takes a while to get into running state,
-        for _ in range(3):
-            self.secmon.wait()
-        target = m3d.Transform(target)
-        while True:
-            if not self.is_running():
-                raise RobotException("Robot stopped")
-            pose = self.get_pose(wait=True)
-            dist = pose.dist(target)
-            self.logger.debug("distance to target is: %s, target dist is %s", dist, radius)
-            if (dist < radius) or not self.secmon.is_program_running():
+        if target is not None:
+            target = m3d.Transform(target)
+        URRobot._wait_for_move(self, radius, target)
+
+    def _is_move_finished(self, radius, target):
+        if not self.is_running():
+            raise RobotException("Robot stopped")
+        if radius and target is not None:
+            dist = self.get_pose().dist(target)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("distance to target is: %s, target dist is %s", dist, radius)
+            if dist < radius:
                 self.logger.debug("move has ended")
-                return
-
+                return True
+        if not self.secmon.is_program_running():
+            self.logger.debug("move has ended")
+            return True
+        return False
 
-if not MATH3D:
-    Robot = URRobot
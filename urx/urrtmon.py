@@ -20,7 +20,7 @@ from copy import deepcopy
 
 import numpy as np
 
-import math3d as m3d
+m3d = None  # python-math3d module, only imported when a csys is set
 
 
 class URRTMonitor(threading.Thread):
@@ -59,6 +59,9 @@ class URRTMonitor(threading.Thread):
         self._csys_lock = threading.Lock()
 
     def set_csys(self, csys):
+        global m3d
+        if csys is not None and m3d is None:
+            import math3d as m3d
         with self._csys_lock:
             self._csys = csys
 
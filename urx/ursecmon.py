@@ -13,12 +13,74 @@ __credits__ = ["Olivier Roulet-Dubonnet"]
 __license__ = "GPLv3"
 
 from threading import Thread, Condition, Lock
+import asyncio
 import logging
+import selectors
 import struct
 import socket
-from copy import copy
 import time
 
+import numpy as np
+
+
+_IOV_MAX = 1024  # max number of buffers passed to one sendmsg call
+
+# precompiled layouts of the fixed size packet types, parallel to their field names
+_PTYPE_STRUCTS = {
+    16: struct.Struct("!iB"),
+    0: struct.Struct("!iBQ???????Bd"),
+    4: struct.Struct("!iBdddddd"),
+    5: struct.Struct("!iB"),
+    3: struct.Struct("!iBhhbbddbbddffff"),
+    2: struct.Struct("!iBbbddfBffB"),
+}
+_PTYPE_NAMES = {
+    16: ("size", "type"),
+    0: ("size", "type", "timestamp", "isRobotConnected", "isRealRobotEnabled", "isPowerOnRobot", "isEmergencyStopped", "isSecurityStopped", "isProgramRunning", "isProgramPaused", "robotMode", "speedFraction"),
+    4: ("size", "type", "X", "Y", "Z", "Rx", "Ry", "Rz"),
+    5: ("size", "type"),
+    3: ("size", "type", "digitalInputBits", "digitalOutputBits", "analogInputRange0", "analogInputRange1", "analogInput0", "analogInput1", "analogInputDomain0", "analogInputDomain1", "analogOutput0", "analogOutput1", "masterBoardTemperature", "robotVoltage48V", "robotCurrent", "masterIOCurrent"),  # not parsed: masterSafetyState, masterOnOffState, euromap67InterfaceInstalled
+    2: ("size", "type", "analoginputRange2", "analoginputRange3", "analogInput2", "analogInput3", "toolVoltage48V", "toolOutputVoltage", "toolCurrent", "toolTemperature", "toolMode"),
+}
+# keys of the fixed size packet types in the parsed dictionnary
+_PTYPE_KEYS = {
+    5: "LaserPointer(OBSOLETE)",
+    3: "MasterBoardData",
+    2: "ToolData",
+}
+# sub packets sent by newer controllers which are not decoded
+_UNPARSED_PTYPES = frozenset(range(6, 14))
+# JointData is parsed as a structured array, one record per joint
+_JOINT_DTYPE = np.dtype([("q_actual", ">f8"), ("q_target", ">f8"), ("qd_actual", ">f8"), ("I_actual", ">f4"), ("V_actual", ">f4"), ("T_motor", ">f4"), ("T_micro", ">f4"), ("jointMode", "u1")])
+_JOINT_DATA_SIZE = 5 + 6 * _JOINT_DTYPE.itemsize
+_JOINT_DATA_NAMES = tuple(tuple(name + str(i) for name in _JOINT_DTYPE.names) for i in range(6))
+# RobotModeData for versions >=3.0 (i.e. 3.0)
+_ROBOT_MODE_V30_STRUCT = struct.Struct("!IBQ???????BBdd")
+_ROBOT_MODE_V30_NAMES = ("size", "type", "timestamp", "isRobotConnected", "isRealRobotEnabled", "isPowerOnRobot", "isEmergencyStopped", "isSecurityStopped", "isProgramRunning", "isProgramPaused", "robotMode", "controlMode", "speedFraction", "speedScaling")
+# RobotModeData bytes 13 to 20 read as one big endian integer: isRobotConnected, isRealRobotEnabled,
+# isPowerOnRobot, isEmergencyStopped, isSecurityStopped, isProgramRunning, isProgramPaused, robotMode
+_MODE_BITS_MASK = 0xffffffffff0000ff  # program state does not matter for running check
+_MODE_BITS_RUNNING = 0x0101010000000000  # robotMode 0 is running before 3.0
+_MODE_BITS_RUNNING_V30 = 0x0101010000000007  # robotMode 7 is running from 3.0
+# packet header: size and type
+_HDR = struct.Struct("!iB")
+# single field structs used by _get_data
+_FIELD_STRUCTS = {f: struct.Struct("!" + f) for f in "bBhHiIqQfd?c"}
+# common header of robot messages (ptype 20)
+_MESSAGE_HEADER_STRUCT = struct.Struct("!iBQbb")
+_MESSAGE_HEADER_NAMES = ("size", "type", "timestamp", "source", "robotMessageType")
+# key, format and field names of robot messages by robotMessageType
+_MESSAGE_FORMATS = {
+    3: ("VersionMessage", "!iBQbb bAbBBiAb", ("size", "type", "timestamp", "source", "robotMessageType", "projectNameSize", "projectName", "majorVersion", "minorVersion", "svnRevision", "buildDate")),
+    6: ("robotCommMessage", "!iBQbb iiAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "messageText")),
+    1: ("labelMessage", "!iBQbb iAc", ("size", "type", "timestamp", "source", "robotMessageType", "id", "messageText")),
+    2: ("popupMessage", "!iBQbb ??BAcAc", ("size", "type", "timestamp", "source", "robotMessageType", "warning", "error", "titleSize", "messageTitle", "messageText")),
+    0: ("messageText", "!iBQbb Ac", ("size", "type", "timestamp", "source", "robotMessageType", "messageText")),
+    8: ("varMessage", "!iBQbb iiBAcAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "titleSize", "messageTitle", "messageText")),
+    7: ("keyMessage", "!iBQbb iiBAcAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "titleSize", "messageTitle", "messageText")),
+    5: ("keyMessage", "!iBQbb iiAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "messageText")),
+}
+
 
 class ParsingException(Exception):
 
@@ -32,11 +94,43 @@ class TimeoutException(Exception):
         Exception.__init__(self, *args)
 
 
+def joint_data_dict(joints):
+    """
+    convert JointData structured array to the dictionnary format with keys q_actual0 ... jointMode5
+    """
+    jdict = {"size": _JOINT_DATA_SIZE, "type": 1}
+    for names, joint in zip(_JOINT_DATA_NAMES, joints.tolist()):
+        jdict.update(zip(names, joint))
+    return jdict
+
+
+def _set_future_done(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
 class ParserUtils(object):
 
-    def __init__(self):
+    def __init__(self, subscribe=None):
+        """
+        subscribe is an optional collection of the packet types to decode, others are skipped
+        """
         self.logger = logging.getLogger(__name__)
         self.is_v30 = False
+        self.mode_bits = 0  # robot state flags of last RobotModeData, see _MODE_BITS_MASK
+        # parser of each packet type, called with packet data, packet type and dictionnary to fill
+        self._parsers = {
+            0: self._parse_robot_mode,
+            1: self._parse_joints,
+            4: self._parse_cartesian,
+            5: self._parse_fixed,
+            3: self._parse_fixed,
+            2: self._parse_fixed,
+            20: self._parse_message,
+        }
+        self._ignored_ptypes = _UNPARSED_PTYPES
+        if subscribe is not None:
+            self._ignored_ptypes = _UNPARSED_PTYPES.union(self._parsers.keys() - set(subscribe))
 
     def parse(self, data):
         """
@@ -44,77 +138,96 @@ class ParserUtils(object):
         """
         allData = {}
         # print "Total size ", len(data)
+        data = memoryview(data)
+        unpack_header = _HDR.unpack_from
+        ignored_ptypes = self._ignored_ptypes
+        get_parser = self._parsers.get
         while data:
-            psize, ptype, pdata, data = self.analyze_header(data)
+            if len(data) < 5:
+                raise ParsingException("Packet size %s smaller than header size (5 bytes)" % len(data))
+            psize, ptype = unpack_header(data)
+            if not 5 <= psize <= len(data):
+                if psize < 5:
+                    raise ParsingException("Error, declared length of data (%s) smaller than its own header (5)" % psize)
+                raise ParsingException("Error, length of data smaller (%s) than declared (%s)" % (len(data), psize))
+            pdata = data[:psize]
             # print "We got packet with size %i and type %s" % (psize, ptype)
             if ptype == 16:
-                allData["SecondaryClientData"] = self._get_data(pdata, "!iB", ("size", "type"))
-                data = (pdata + data)[5:]  # This is the total size so we resend data to parser
-            elif ptype == 0:
-                # this parses RobotModeData for versions >=3.0 (i.e. 3.0)
-                if psize == 38:
-                    self.is_v30 = True
-                    allData['RobotModeData'] = self._get_data(pdata, "!IBQ???????BBdd", ("size", "type", "timestamp", "isRobotConnected", "isRealRobotEnabled", "isPowerOnRobot", "isEmergencyStopped", "isSecurityStopped", "isProgramRunning", "isProgramPaused", "robotMode", "controlMode", "speedFraction", "speedScaling"))
-                else:
-                    allData["RobotModeData"] = self._get_data(pdata, "!iBQ???????Bd", ("size", "type", "timestamp", "isRobotConnected", "isRealRobotEnabled", "isPowerOnRobot", "isEmergencyStopped", "isSecurityStopped", "isProgramRunning", "isProgramPaused", "robotMode", "speedFraction"))
-            elif ptype == 1:
-                tmpstr = ["size", "type"]
-                for i in range(0, 6):
-                    tmpstr += ["q_actual%s" % i, "q_target%s" % i, "qd_actual%s" % i, "I_actual%s" % i, "V_actual%s" % i, "T_motor%s" % i, "T_micro%s" % i, "jointMode%s" % i]
-
-                allData["JointData"] = self._get_data(pdata, "!iB dddffffB dddffffB dddffffB dddffffB dddffffB dddffffB", tmpstr)
-
-            elif ptype == 4:
-                allData["CartesianInfo"] = self._get_data(pdata, "iBdddddd", ("size", "type", "X", "Y", "Z", "Rx", "Ry", "Rz"))
-            elif ptype == 5:
-                allData["LaserPointer(OBSOLETE)"] = self._get_data(pdata, "iBddd", ("size", "type"))
-            elif ptype == 3:
-                allData["MasterBoardData"] = self._get_data(pdata, "iBhhbbddbbddffffBBb", ("size", "type", "digitalInputBits", "digitalOutputBits", "analogInputRange0", "analogInputRange1", "analogInput0", "analogInput1", "analogInputDomain0", "analogInputDomain1", "analogOutput0", "analogOutput1", "masterBoardTemperature", "robotVoltage48V", "robotCurrent", "masterIOCurrent"))  # , "masterSafetyState" ,"masterOnOffState", "euromap67InterfaceInstalled"   ))
-            elif ptype == 2:
-                allData["ToolData"] = self._get_data(pdata, "iBbbddfBffB", ("size", "type", "analoginputRange2", "analoginputRange3", "analogInput2", "analogInput3", "toolVoltage48V", "toolOutputVoltage", "toolCurrent", "toolTemperature", "toolMode"))
-
-            # elif ptype == 8:
-                #allData["varMessage"] = self._get_data(pdata, "!iBQbb iiBAcAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "titleSize", "messageTitle", "messageText"))
-            # elif ptype == 7:
-                #allData["keyMessage"] = self._get_data(pdata, "!iBQbb iiBAcAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "titleSize", "messageTitle", "messageText"))
-
-            elif ptype == 20:
-                tmp = self._get_data(pdata, "!iB Qbb", ("size", "type", "timestamp", "source", "robotMessageType"))
-                if tmp["robotMessageType"] == 3:
-                    allData["VersionMessage"] = self._get_data(pdata, "!iBQbb bAbBBiAb", ("size", "type", "timestamp", "source", "robotMessageType", "projectNameSize", "projectName", "majorVersion", "minorVersion", "svnRevision", "buildDate"))
-                elif tmp["robotMessageType"] == 6:
-                    allData["robotCommMessage"] = self._get_data(pdata, "!iBQbb iiAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "messageText"))
-                elif tmp["robotMessageType"] == 1:
-                    allData["labelMessage"] = self._get_data(pdata, "!iBQbb iAc", ("size", "type", "timestamp", "source", "robotMessageType", "id", "messageText"))
-                elif tmp["robotMessageType"] == 2:
-                    allData["popupMessage"] = self._get_data(pdata, "!iBQbb ??BAcAc", ("size", "type", "timestamp", "source", "robotMessageType", "warning", "error", "titleSize", "messageTitle", "messageText"))
-                elif tmp["robotMessageType"] == 0:
-                    allData["messageText"] = self._get_data(pdata, "!iBQbb Ac", ("size", "type", "timestamp", "source", "robotMessageType", "messageText"))
-                elif tmp["robotMessageType"] == 8:
-                    allData["varMessage"] = self._get_data(pdata, "!iBQbb iiBAcAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "titleSize", "messageTitle", "messageText"))
-                elif tmp["robotMessageType"] == 7:
-                    allData["keyMessage"] = self._get_data(pdata, "!iBQbb iiBAcAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "titleSize", "messageTitle", "messageText"))
-                elif tmp["robotMessageType"] == 5:
-                    allData["keyMessage"] = self._get_data(pdata, "!iBQbb iiAc", ("size", "type", "timestamp", "source", "robotMessageType", "code", "argument", "messageText"))
+                allData["SecondaryClientData"] = self._unpack(pdata, ptype)
+                data = data[5:]  # This is the total size so we resend data to parser
+                continue
+            elif ptype not in ignored_ptypes:
+                parser = get_parser(ptype)
+                if parser:
+                    parser(pdata, ptype, allData)
                 else:
-                    self.logger.debug("Message type parser not implemented %s", tmp)
-            else:
-                self.logger.debug("Unknown packet type %s with size %s", ptype, psize)
+                    self.logger.debug("Unknown packet type %s with size %s", ptype, psize)
+            data = data[psize:]
 
         return allData
 
+    def _parse_robot_mode(self, pdata, ptype, allData):
+        if len(pdata) == 38:
+            self.is_v30 = True
+            allData["RobotModeData"] = self._unpack(pdata, ptype, _ROBOT_MODE_V30_STRUCT, _ROBOT_MODE_V30_NAMES)
+        else:
+            allData["RobotModeData"] = self._unpack(pdata, ptype)
+        self.mode_bits = int.from_bytes(pdata[13:21], "big")
+
+    def _parse_joints(self, pdata, ptype, allData):
+        allData["JointData"] = self._unpack_joints(pdata)
+
+    def _parse_cartesian(self, pdata, ptype, allData):
+        allData["CartesianInfo"] = self._unpack(pdata, ptype)
+        pose = np.frombuffer(pdata, dtype=">f8", count=6, offset=5).astype(float)
+        pose.flags.writeable = False
+        allData["CartesianPose"] = pose
+
+    def _parse_fixed(self, pdata, ptype, allData):
+        allData[_PTYPE_KEYS[ptype]] = self._unpack(pdata, ptype)
+
+    def _parse_message(self, pdata, ptype, allData):
+        tmp = self._unpack(pdata, ptype, _MESSAGE_HEADER_STRUCT, _MESSAGE_HEADER_NAMES)
+        msg_format = _MESSAGE_FORMATS.get(tmp["robotMessageType"])
+        if msg_format:
+            key, fmt, names = msg_format
+            allData[key] = self._get_data(pdata, fmt, names)
+        else:
+            self.logger.debug("Message type parser not implemented %s", tmp)
+
+    def _unpack(self, data, ptype, fmt=None, names=None):
+        """
+        fill data of a fixed size packet into a dictionary
+        using the precompiled struct of ptype if fmt is not given
+        """
+        if fmt is None:
+            fmt = _PTYPE_STRUCTS[ptype]
+            names = _PTYPE_NAMES[ptype]
+        if len(data) < fmt.size:  # seems to happen on windows
+            raise ParsingException("Error, length of data (%s) smaller than advertized (%s) for packet type %s" % (len(data), fmt.size, ptype))
+        return dict(zip(names, fmt.unpack_from(data)))
+
+    def _unpack_joints(self, data):
+        """
+        return JointData as a numpy structured array with one record per joint
+        the array is a view on data, which must not be modified afterwards
+        """
+        if len(data) < _JOINT_DATA_SIZE:
+            raise ParsingException("Error, length of data (%s) smaller than advertized (%s) for packet type 1" % (len(data), _JOINT_DATA_SIZE))
+        return np.frombuffer(data, dtype=_JOINT_DTYPE, count=6, offset=5)
+
     def _get_data(self, data, fmt, names):
         """
-        fill data into a dictionary
+        fill data into a dictionary, used for variable size robot messages
             data is data from robot packet
             fmt is struct format, but with added A for arrays and no support for numerical in fmt
             names args are strings used to store values
         """
-        tmpdata = copy(data)
         fmt = fmt.strip()  # space may confuse us
         d = dict()
         i = 0
         j = 0
+        offset = 0
         while j < len(fmt) and i < len(names):
             f = fmt[j]
             if f in (" ", "!", ">", "<"):
@@ -122,78 +235,84 @@ class ParserUtils(object):
             elif f == "A":  # we got an array
                 # first we need to find its size
                 if j == len(fmt) - 2:  # we are last element, size is the rest of data in packet
-                    arraysize = len(tmpdata)
+                    arraysize = len(data) - offset
                 else:  # size should be given in last element
                     asn = names[i - 1]
                     if not asn.endswith("Size"):
                         raise ParsingException("Error, array without size ! %s %s" % (asn, i))
                     else:
                         arraysize = d[asn]
-                d[names[i]] = tmpdata[0:arraysize]
+                d[names[i]] = bytes(data[offset:offset + arraysize])
                 # print "Array is ", names[i], d[names[i]]
-                tmpdata = tmpdata[arraysize:]
+                offset += arraysize
                 j += 2
                 i += 1
             else:
-                fmtsize = struct.calcsize(fmt[j])
-                # print "reading ", f , i, j,  fmtsize, len(tmpdata)
-                if len(tmpdata) < fmtsize:  # seems to happen on windows
-                    raise ParsingException("Error, length of data smaller than advertized: ", len(tmpdata), fmtsize, "for names ", names, f, i, j)
-                d[names[i]] = struct.unpack("!" + f, tmpdata[0:fmtsize])[0]
+                field = _FIELD_STRUCTS[f]
+                fmtsize = field.size
+                # print "reading ", f , i, j,  fmtsize, len(data) - offset
+                if len(data) - offset < fmtsize:  # seems to happen on windows
+                    raise ParsingException("Error, length of data (%s) smaller than advertized (%s) for %s in %s" % (len(data) - offset, fmtsize, names[i], names))
+                d[names[i]] = field.unpack_from(data, offset)[0]
                 # print names[i], d[names[i]]
-                tmpdata = tmpdata[fmtsize:]
+                offset += fmtsize
                 j += 1
                 i += 1
         return d
 
-    def get_header(self, data):
-        return struct.unpack("!iB", data[0:5])
-
-    def analyze_header(self, data):
-        """
-        read first 5 bytes and return complete packet
-        """
-        if not len(data) >= 5:
-            raise ParsingException("Packet size %s smaller than header size (5 bytes)" % len(data))
-        else:
-            psize, ptype = self.get_header(data)
-            if psize < 5:
-                raise ParsingException("Error, declared length of data smaller than its own header(5): ", psize)
-            elif psize > len(data):
-                raise ParsingException("Error, length of data smaller (%s) than declared (%s)" % (len(data), psize))
-        return psize, ptype, data[:psize], data[psize:]
-
-    def find_first_packet(self, data):
+    def find_first_packet(self, data, start=0):
         """
-        find the first complete packet in a string
-        returns None if none found
+        find the first complete packet in data, starting at index start
+        returns (index, size) of the packet or None if none found
         """
         counter = 0
         limit = 10
+        unpack_header = _HDR.unpack_from
+        size = len(data)
         while True:
-            if len(data) >= 5:
-                psize, ptype = self.get_header(data)
+            if size - start >= 5:
+                psize, ptype = unpack_header(data, start)
                 if psize < 5 or psize > 2000 or ptype != 16:
-                    data = data[1:]
+                    start += 1
                     counter += 1
                     if counter > limit:
-                        self.logger.warn("tried %s times to find a packet in data, advertised packet size: %s, type: %s", counter, psize, ptype)
-                        self.logger.warn("Data length: %s", len(data))
+                        self.logger.warning("tried %s times to find a packet in data, advertised packet size: %s, type: %s", counter, psize, ptype)
+                        self.logger.warning("Data length: %s", size - start)
                         limit = limit * 10
-                elif len(data) >= psize:
+                elif size - start >= psize:
                     self.logger.debug("Got packet with size %s and type %s", psize, ptype)
                     if counter:
                         self.logger.info("Remove %s bytes of garbage at begining of packet", counter)
                     # ok we we have somehting which looks like a packet"
-                    return (data[:psize], data[psize:])
+                    return start, psize
                 else:
                     #packet is not complete
-                    self.logger.debug("Packet is not complete, advertised size is %s, received size is %s, type is %s", psize, len(data), ptype)
+                    self.logger.debug("Packet is not complete, advertised size is %s, received size is %s, type is %s", psize, size - start, ptype)
                     return None
             else:
                 #self.logger.debug("data smaller than 5 bytes")
                 return None
 
+    def find_last_complete_packet(self, data, start=0):
+        """
+        find the last of the complete packets following each other in data, starting at index start
+        returns (index, size) of the packet or None if none found
+        """
+        ans = self.find_first_packet(data, start)
+        if ans is None:
+            return None
+        last, psize = ans
+        unpack_header = _HDR.unpack_from
+        size = len(data)
+        start = last + psize
+        while size - start >= 5:
+            psize, ptype = unpack_header(data, start)
+            if psize < 5 or psize > 2000 or ptype != 16 or size - start < psize:
+                break  # incomplete packet or garbage, left for next call
+            last = start
+            start += psize
+        return last, start - last
+
 
 class SecondaryMonitor(Thread):
 
@@ -201,25 +320,44 @@ class SecondaryMonitor(Thread):
     Monitor data from secondary port and send programs to robot
     """
 
-    def __init__(self, host):
+    def __init__(self, host, subscribe=None):
+        """
+        subscribe is an optional collection of the packet types to decode, i.e. {1, 4} for joints and TCP pose
+        RobotModeData (type 0) is always decoded since it tells whether the robot is running
+        """
         Thread.__init__(self)
         self.logger = logging.getLogger(self.__class__.__name__)
-        self._parser = ParserUtils()
-        self._dict = {}
-        self._dictLock = Lock()
+        if subscribe is not None:
+            subscribe = set(subscribe) | {0}
+        self._parser = ParserUtils(subscribe)
+        self._dict = {}  # replaced, never modified, for every packet so it can be read without lock
         self.host = host
         secondary_port = 30002    # Secondary client interface on Universal Robots
         self._s_secondary = socket.create_connection((self.host, secondary_port), timeout=0.5)
+        self._s_secondary.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # do not delay small programs
+        self._s_secondary.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+        self._s_secondary.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._s_secondary, selectors.EVENT_READ)
         self._prog_queue = []
         self._prog_queue_lock = Lock()
-        self._dataqueue = bytes()
+        self._prog_sent_pid = 0  # packet id when queued programs were last written, None while some are queued
+        self._rx_buf = bytearray(65536)  # received data, not yet parsed between _rx_start and _rx_end
+        self._rx_view = memoryview(self._rx_buf)
+        self._rx_start = 0
+        self._rx_end = 0
         self._trystop = False  # to stop thread
         self.running = False  # True when robot is on and listening
         self._dataEvent = Condition()
         self.lastpacket_timestamp = 0
+        self._packet_id = 0  # incremented for every parsed packet, under _dataEvent
+        self._async_waiters = []  # (loop, future) waiting for next packet
+        self._async_lock = Lock()
+        self._joint_arrays = (None, None)  # (JointData array, (q_actual, q_target))
+        self._joint_dict = (None, None)  # (JointData array, JointData in dictionnary format)
 
         self.start()
-        self.wait()  # make sure we got some data before someone calls us
+        self.wait_for_fresh(0)  # make sure we got some data before someone calls us
 
     def send_program(self, prog):
         """
@@ -231,7 +369,25 @@ class SecondaryMonitor(Thread):
         if not isinstance(prog, bytes):
             prog = prog.encode()
         with self._prog_queue_lock:
-            self._prog_queue.append(prog + b"\n")
+            self._prog_queue.append([prog + b"\n"])
+            self._prog_sent_pid = None
+
+    def send_program_bytes(self, chunks):
+        """
+        send a program already encoded as a list of bytes chunks
+        chunks are written to the socket in one call without being concatenated
+        """
+        with self._prog_queue_lock:
+            self._prog_queue.append(list(chunks))
+            self._prog_sent_pid = None
+
+    def _send_chunks(self, chunks):
+        if hasattr(self._s_secondary, "sendmsg") and len(chunks) <= _IOV_MAX:
+            sent = self._s_secondary.sendmsg(chunks)
+            if sent < sum(len(c) for c in chunks):
+                self._s_secondary.sendall(b"".join(chunks)[sent:])
+        else:
+            self._s_secondary.sendall(b"".join(chunks))
 
     def run(self):
         """
@@ -240,110 +396,210 @@ class SecondaryMonitor(Thread):
         Only the last connected client is the primary client,
         so this is not guaranted and we cannot rely on information to the primary client.
         """
+        parser = self._parser
+        prog_queue_lock = self._prog_queue_lock
+        data_event = self._dataEvent
+        get_data = self._get_data
+        logger = self.logger
 
         while not self._trystop:
-            with self._prog_queue_lock:
-                if len(self._prog_queue) > 0:
-                    prog = self._prog_queue.pop(0)
-                    self._s_secondary.send(prog)
-
-            data = self._get_data()
+            with prog_queue_lock:
+                progs, self._prog_queue = self._prog_queue, []
+            if progs:
+                # everything queued since last loop goes in one write
+                self._send_chunks([chunk for prog in progs for chunk in prog])
+                with prog_queue_lock:
+                    if not self._prog_queue:  # nothing queued during the write
+                        self._prog_sent_pid = self._packet_id
+
+            data = get_data()
+            if data is None:
+                continue
             try:
-                tmpdict = self._parser.parse(data)
-                with self._dictLock:
-                    self._dict = tmpdict
+                tmpdict = parser.parse(data)
             except ParsingException as ex:
-                self.logger.warn("Error parsing one packet from urrobot: " + str(ex))
+                logger.warning("Error parsing one packet from urrobot: " + str(ex))
                 continue
+            self._dict = tmpdict
 
-            if "RobotModeData" not in self._dict:
-                self.logger.warn("Got a packet from robot without RobotModeData, strange ...")
+            if "RobotModeData" not in tmpdict:
+                logger.warning("Got a packet from robot without RobotModeData, strange ...")
                 continue
 
             self.lastpacket_timestamp = time.time()
 
-            if self._parser.is_v30:
-                if self._dict["RobotModeData"]["robotMode"] == 7 \
-                        and self._dict["RobotModeData"]["isRealRobotEnabled"] == True \
-                        and self._dict["RobotModeData"]["isEmergencyStopped"] == False \
-                        and self._dict["RobotModeData"]["isSecurityStopped"] == False \
-                        and self._dict["RobotModeData"]["isRobotConnected"] == True \
-                        and self._dict["RobotModeData"]["isPowerOnRobot"] == True:
-                    self.running = True
+            running_bits = _MODE_BITS_RUNNING_V30 if parser.is_v30 else _MODE_BITS_RUNNING
+            if parser.mode_bits & _MODE_BITS_MASK == running_bits:
+                self.running = True
             else:
-                if self._dict["RobotModeData"]["robotMode"] == 0 \
-                        and self._dict["RobotModeData"]["isRealRobotEnabled"] == True \
-                        and self._dict["RobotModeData"]["isEmergencyStopped"] == False \
-                        and self._dict["RobotModeData"]["isSecurityStopped"] == False \
-                        and self._dict["RobotModeData"]["isRobotConnected"] == True \
-                        and self._dict["RobotModeData"]["isPowerOnRobot"] == True:
-                    self.running = True
-                else:
-                    if self.running:
-                        self.logger.error("Robot not running: " + str(self._dict["RobotModeData"]))
-                    self.running = False
-                with self._dataEvent:
-                    #print("X: new data")
-                    self._dataEvent.notifyAll()
+                if self.running:
+                    logger.error("Robot not running: " + str(tmpdict["RobotModeData"]))
+                self.running = False
+            # the packet id is updated last: whoever sees it also sees the new data
+            with data_event:
+                #print("X: new data")
+                self._packet_id += 1
+                data_event.notify_all()
+            self._wake_async_waiters()
 
     def _get_data(self):
         """
         returns something that looks like a packet, nothing is guaranted
+        if several packets have been received only the last one is returned, older ones are dropped
+        returns None if no complete packet was received within 0.1s or if robot closed the connection
         """
         while True:
-            #self.logger.debug("data queue size is: {}".format(len(self._dataqueue)))
-            ans = self._parser.find_first_packet(self._dataqueue[:])
+            #self.logger.debug("data queue size is: {}".format(self._rx_end - self._rx_start))
+            ans = self._parser.find_last_complete_packet(self._rx_view[:self._rx_end], self._rx_start)
             if ans:
-                self._dataqueue = ans[1]
-                #self.logger.debug("found packet of size {}".format(len(ans[0])))
-                return ans[0]
+                start, psize = ans
+                #self.logger.debug("found packet of size {}".format(psize))
+                self._rx_start = start + psize
+                return bytes(self._rx_view[start:self._rx_start])
             else:
                 #self.logger.debug("Could not find packet in received data")
-                tmp = self._s_secondary.recv(1024)
-                self._dataqueue += tmp
+                if not self._selector.select(timeout=0.1):
+                    return None  # give run a chance to send programs and check for stop
+                if self._rx_end > len(self._rx_buf) * 3 // 4:
+                    self._compact_rx_buf()
+                nbytes = self._s_secondary.recv_into(self._rx_view[self._rx_end:])
+                if nbytes == 0:
+                    self.logger.error("Connection closed by robot, stopping secondary monitor")
+                    self.running = False
+                    self._trystop = True  # nothing more will ever be received
+                    return None
+                self._rx_end += nbytes
+
+    def _compact_rx_buf(self):
+        """
+        move data not yet parsed to the beginning of the receive buffer
+        """
+        unread = self._rx_end - self._rx_start
+        if unread > len(self._rx_buf) // 2:
+            # far more than a packet, this cannot be anything else than garbage
+            self.logger.warning("Dropping %s bytes of received data without any valid packet", unread)
+            unread = 0
+        else:
+            self._rx_view[:unread] = self._rx_view[self._rx_start:self._rx_end]
+        self._rx_start = 0
+        self._rx_end = unread
 
     def wait(self, timeout=0.5):
         """
         wait for next data packet from robot
         """
-        tstamp = self.lastpacket_timestamp
+        self.wait_for_fresh(self._packet_id, timeout)
+
+    def wait_for_fresh(self, since, timeout=0.5):
+        """
+        wait for a data packet newer than packet id since, see get_packet_id
+        returns at once if one was already received, otherwise waits at most timeout seconds
+        returns the id of the last packet
+        """
         with self._dataEvent:
-            self._dataEvent.wait(timeout)
-            if tstamp == self.lastpacket_timestamp:
+            if not self._dataEvent.wait_for(lambda: self._packet_id > since, timeout):
                 raise TimeoutException("Did not receive a valid data packet from robot in {}".format(timeout))
+            return self._packet_id
+
+    def _wake_async_waiters(self):
+        with self._async_lock:
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_future_done, fut)
+            except RuntimeError:
+                pass  # loop of waiter has been closed since, nobody is waiting anymore
+
+    async def wait_async(self, timeout=0.5):
+        """
+        coroutine waiting for next data packet from robot
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        waiter = (loop, fut)
+        with self._async_lock:
+            self._async_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutException("Did not receive a valid data packet from robot in {}".format(timeout))
+        finally:
+            with self._async_lock:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+
+    def get_packet_id(self):
+        """
+        return a counter incremented every time a new packet has been parsed
+        """
+        return self._packet_id
+
+    def get_program_packet_id(self):
+        """
+        return id of the last packet parsed before queued programs were written to the robot
+        None while a program is waiting to be written
+        """
+        return self._prog_sent_pid
 
     def get_cartesian_info(self, wait=False):
         if wait:
             self.wait()
-        with self._dictLock:
-            if "CartesianInfo" in self._dict:
-                return self._dict["CartesianInfo"]
-            else:
-                return None
+        return self._dict.get("CartesianInfo")
+
+    def get_cartesian_array(self, wait=False):
+        """
+        return TCP pose as a read-only numpy array X, Y, Z, Rx, Ry, Rz
+        A new array is created for every packet, it can be kept without copy
+        """
+        if wait:
+            self.wait()
+        return self._dict.get("CartesianPose")
 
     def get_all_data(self, wait=False):
         """
         return last data obtained from robot in dictionnary format
+        The dictionnary is shared with other callers and must not be modified
         """
         if wait:
             self.wait()
-        with self._dictLock:
-            return self._dict.copy()
+        return self._dict
 
     def get_joint_data(self, wait=False):
+        """
+        return JointData in dictionnary format, with keys q_actual0 ... jointMode5
+        get_all_data()["JointData"] is a numpy structured array with one record per joint
+        """
         if wait:
             self.wait()
-        with self._dictLock:
-            if "JointData" in self._dict:
-                return self._dict["JointData"]
-            else:
-                return None
+        jts = self._dict.get("JointData")
+        if jts is None:
+            return None
+        cached_jts, jdict = self._joint_dict
+        if cached_jts is not jts:
+            jdict = joint_data_dict(jts)
+            self._joint_dict = (jts, jdict)
+        return jdict
+
+    def get_joint_arrays(self, wait=False):
+        """
+        return actual and target joint positions as two numpy arrays of length 6
+        arrays are computed once per packet and must not be modified
+        """
+        if wait:
+            self.wait()
+        jts = self._dict.get("JointData")
+        if jts is None:
+            return None
+        cached_jts, arrays = self._joint_arrays
+        if cached_jts is not jts:
+            arrays = (jts["q_actual"].astype(float), jts["q_target"].astype(float))
+            self._joint_arrays = (jts, arrays)
+        return arrays
 
     def get_digital_out(self, nb, wait=False):
         if wait:
             self.wait()
-        with self._dictLock:
-            output = self._dict["MasterBoardData"]["digitalOutputBits"]
+        output = self._dict["MasterBoardData"]["digitalOutputBits"]
         mask = 1 << nb
         if output & mask:
             return 1
@@ -353,8 +609,7 @@ class SecondaryMonitor(Thread):
     def get_digital_in(self, nb, wait=False):
         if wait:
             self.wait()
-        with self._dictLock:
-            output = self._dict["MasterBoardData"]["digitalInputBits"]
+        output = self._dict["MasterBoardData"]["digitalInputBits"]
         mask = 1 << nb
         if output & mask:
             return 1
@@ -364,20 +619,18 @@ class SecondaryMonitor(Thread):
     def get_analog_in(self, nb, wait=False):
         if wait:
             self.wait()
-        with self._dictLock:
-            return self._dict["MasterBoardData"]["analogInput" + str(nb)]
+        return self._dict["MasterBoardData"]["analogInput" + str(nb)]
 
     def get_digital_in_bits(self, wait=False):
         if wait:
             self.wait()
-        with self._dictLock:
-            return self._dict["MasterBoardData"]["digitalInputBits"]
+        return self._dict["MasterBoardData"]["digitalInputBits"]
 
     def get_analog_inputs(self, wait=False):
         if wait:
             self.wait()
-        with self._dictLock:
-            return self._dict["MasterBoardData"]["analogInput0"], self._dict["MasterBoardData"]["analogInput1"]
+        mb_data = self._dict["MasterBoardData"]
+        return mb_data["analogInput0"], mb_data["analogInput1"]
 
     def is_program_running(self, wait=False):
         """
@@ -386,14 +639,14 @@ class SecondaryMonitor(Thread):
         """
         if wait:
             self.wait()
-        with self._dictLock:
-            return self._dict["RobotModeData"]["isProgramRunning"]
+        return self._dict["RobotModeData"]["isProgramRunning"]
 
     def close(self):
         self._trystop = True
         self.join()
         # with self._dataEvent: #wake up any thread that may be waiting for data before we close. Should we do that?
         # self._dataEvent.notifyAll()
+        self._selector.close()
         if self._s_secondary:
             with self._prog_queue_lock:
                 self._s_secondary.close()